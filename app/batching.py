@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from concurrent.futures import Executor
+from functools import partial
+from itertools import groupby
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:  # pragma: no cover - keeps the scheduler importable without llama_cpp
+    from .llm import EmbeddingModel
+
+logger = logging.getLogger(__name__)
+
+
+class BatchScheduler:
+    """Coalesce concurrent embedding requests into shared llama.cpp calls."""
+
+    def __init__(
+        self,
+        model: EmbeddingModel,
+        *,
+        max_batch_size: int,
+        max_wait_ms: float,
+        max_concurrency: int = 1,
+        executor: Executor | None = None,
+    ) -> None:
+        self._model = model
+        self._executor = executor
+        self._max_batch_size = max(1, max_batch_size)
+        self._max_wait = max(0.0, max_wait_ms) / 1_000
+        self._queue: asyncio.Queue[tuple[str, bool, asyncio.Future]] = asyncio.Queue()
+        # One slot per in-flight llama.cpp call; batches collect while every slot is busy.
+        self._slots = asyncio.Semaphore(max(1, max_concurrency))
+        self._inflight: set[asyncio.Task] = set()
+        self._worker: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            for task in list(self._inflight):
+                task.cancel()
+            await asyncio.gather(self._worker, *self._inflight, return_exceptions=True)
+            self._worker = None
+        # Entries queued after the worker exited would otherwise never be answered.
+        self._fail_queued(RuntimeError("embedding scheduler stopped"))
+
+    @staticmethod
+    def _fail(entries: list[tuple[str, bool, asyncio.Future]], exc: BaseException) -> None:
+        for _, _, future in entries:
+            if not future.done():
+                future.set_exception(exc)
+
+    def _fail_queued(self, exc: BaseException) -> None:
+        while not self._queue.empty():
+            self._fail([self._queue.get_nowait()], exc)
+
+    async def submit(self, text: str, *, normalize: bool = True) -> tuple[list[float], int]:
+        """Queue ``text`` and resolve to its embedding and prompt token count."""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, normalize, future))
+        return await future
+
+    async def _collect(self) -> list[tuple[str, bool, asyncio.Future]]:
+        """Block for one entry, then drain until the batch is full or the window closes."""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self._max_wait
+
+        try:
+            while len(batch) < self._max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+        except BaseException:
+            # Entries already taken off the queue must not be dropped with the worker.
+            self._fail(batch, RuntimeError("embedding scheduler stopped"))
+            raise
+        return batch
+
+    async def _dispatch(self, batch: list[tuple[str, bool, asyncio.Future]]) -> None:
+        loop = asyncio.get_running_loop()
+        # Entries only share a llama.cpp call when they agree on normalization.
+        batch.sort(key=lambda entry: entry[1])
+
+        for normalize, group in groupby(batch, key=lambda entry: entry[1]):
+            entries = [entry for entry in group if not entry[2].done()]
+            if not entries:
+                continue
+            texts = [text for text, _, _ in entries]
+            try:
+                vectors, token_counts = await loop.run_in_executor(
+                    self._executor,
+                    partial(self._model.embed_with_usage, texts, normalize=normalize),
+                )
+            except Exception as exc:
+                self._fail(entries, exc)
+                continue
+
+            if len(vectors) != len(entries) or len(token_counts) != len(entries):
+                # Results cannot be matched to callers, so fail the whole group rather
+                # than leave any future (and its HTTP request) waiting forever.
+                mismatch = RuntimeError(
+                    f"embedding model returned {len(vectors)} vectors and "
+                    f"{len(token_counts)} token counts for {len(entries)} inputs"
+                )
+                self._fail(entries, mismatch)
+                continue
+
+            for (_, _, future), vector, count in zip(entries, vectors, token_counts):
+                if not future.done():
+                    future.set_result((vector, count))
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                await self._slots.acquire()
+                try:
+                    batch = await self._collect()
+                except BaseException:
+                    self._slots.release()
+                    raise
+                task = loop.create_task(self._process(batch))
+                self._inflight.add(task)
+                task.add_done_callback(self._inflight.discard)
+        except asyncio.CancelledError:
+            self._fail_queued(RuntimeError("embedding scheduler stopped"))
+            raise
+        except Exception as exc:
+            # A dead worker must turn queued requests into errors, not hung requests.
+            logger.exception("Embedding batch worker died.")
+            self._fail_queued(RuntimeError(f"embedding scheduler failed: {exc}"))
+            raise
+
+    async def _process(self, batch: list[tuple[str, bool, asyncio.Future]]) -> None:
+        try:
+            await self._dispatch(batch)
+        except asyncio.CancelledError:
+            self._fail(batch, RuntimeError("embedding scheduler stopped"))
+            raise
+        except Exception:  # pragma: no cover - keep the worker alive
+            logger.exception("Embedding batch dispatch failed.")
+            self._fail(batch, RuntimeError("embedding batch failed"))
+        finally:
+            self._slots.release()
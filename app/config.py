@@ -16,10 +16,16 @@ class Settings(BaseSettings):
     model_file: str = Field(
         default="nomic-embed-text-v1.5.Q4_K_M.gguf", alias="MODEL_FILE"
     )
-    model_cache_dir: Path = Field(default=Path(".models"), alias="MODEL_CACHE_DIR")
-    threads: int = Field(default=4, alias="THREADS")
-    batch_size: int = Field(default=64, alias="LLM_BATCH_SIZE")
+    model_cache_dir: Path | None = Field(default=None, alias="MODEL_CACHE_DIR")
+    threads: int | None = Field(default=None, alias="THREADS")
+    threads_batch: int | None = Field(default=None, alias="THREADS_BATCH")
+    pool_size: int = Field(default=1, ge=1, alias="CONTEXT_POOL_SIZE")
+    gpu_layers: int = Field(default=0, alias="GPU_LAYERS")
+    batch_size: int = Field(default=512, alias="LLM_BATCH_SIZE")
+    ubatch_size: int = Field(default=512, alias="LLM_UBATCH_SIZE")
     max_batch_size: int = Field(default=32, alias="MAX_BATCH_SIZE")
+    batch_wait_ms: float = Field(default=10.0, alias="BATCH_WAIT_MS")
+    embedding_cache_size: int = Field(default=1024, ge=0, alias="EMBEDDING_CACHE_SIZE")
     context_window: int = Field(default=8192, alias="CONTEXT_WINDOW")
     server_timeout: int = Field(default=60, alias="SERVER_TIMEOUT")
     embedding_pooling: Literal["mean", "cls", "none"] = Field(
@@ -34,7 +40,9 @@ class Settings(BaseSettings):
     )
 
     @property
-    def model_path(self) -> Path:
+    def model_path(self) -> Path | None:
+        if self.model_cache_dir is None:
+            return None
         return (self.model_cache_dir / self.model_file).resolve()
 
 
@@ -1,17 +1,26 @@
 from __future__ import annotations
 
+import logging
+import os
+import queue
 import threading
-import math
-from functools import lru_cache
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from hashlib import blake2b
 from inspect import signature
 from pathlib import Path
 from typing import Iterable, List
 
+import llama_cpp
+import numpy as np
 from huggingface_hub import hf_hub_download
 from llama_cpp import Llama
 
 from .config import settings
 
+logger = logging.getLogger(__name__)
+
 try:
     from llama_cpp import LlamaEmbeddingPoolingType
 
@@ -34,49 +43,223 @@ except (ValueError, TypeError):  # pragma: no cover - defensive guard
     _CREATE_EMBEDDING_ACCEPTS_POOLING = False
     _CREATE_EMBEDDING_ACCEPTS_NORMALIZE = False
 
+# Bind the create_embedding call shape once instead of building kwargs per chunk.
+# Normalization always happens in NumPy afterwards, so llama.cpp is asked not to.
+if _CREATE_EMBEDDING_ACCEPTS_POOLING and _CREATE_EMBEDDING_ACCEPTS_NORMALIZE:
+
+    def _call_embed(llama: Llama, chunk: list[str], pooling: object) -> dict:
+        return llama.create_embedding(chunk, normalize=False, pooling_type=pooling)
+
+elif _CREATE_EMBEDDING_ACCEPTS_POOLING:
+
+    def _call_embed(llama: Llama, chunk: list[str], pooling: object) -> dict:
+        return llama.create_embedding(chunk, pooling_type=pooling)
+
+elif _CREATE_EMBEDDING_ACCEPTS_NORMALIZE:
+
+    def _call_embed(llama: Llama, chunk: list[str], pooling: object) -> dict:
+        return llama.create_embedding(chunk, normalize=False)
+
+else:
+
+    def _call_embed(llama: Llama, chunk: list[str], pooling: object) -> dict:
+        return llama.create_embedding(chunk)
+
+# Decoding pre-tokenized inputs goes through the same low-level batch API that
+# ``Llama.embed`` uses internally; older bindings fall back to ``create_embedding``.
+_TOKEN_DECODE_BINDINGS = all(
+    hasattr(llama_cpp, name)
+    for name in (
+        "llama_kv_cache_clear",
+        "llama_get_embeddings",
+        "llama_get_embeddings_seq",
+        "llama_pooling_type",
+        "LLAMA_POOLING_TYPE_NONE",
+    )
+)
+
+
+def _available_cores() -> int:
+    """Count the CPUs this process may run on, honoring affinity masks where supported."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # pragma: no cover - macOS / Windows
+        return os.cpu_count() or 1
+
+
+# llama_tokenize is a ctypes call that releases the GIL, so large payloads tokenize in
+# parallel; below this size the executor hand-off costs more than it saves.
+_PARALLEL_TOKENIZE_MIN_INPUTS = 8
+TOKENIZER_POOL = ThreadPoolExecutor(
+    max_workers=_available_cores(), thread_name_prefix="tokenize"
+)
+
+
+def _gpu_offload_enabled() -> bool:
+    if settings.gpu_layers == 0:
+        return False
+    supports_offload = getattr(llama_cpp, "llama_supports_gpu_offload", None)
+    if supports_offload is not None and not supports_offload():
+        logger.warning(
+            "GPU_LAYERS=%s ignored: this llama_cpp build has no GPU offload support.",
+            settings.gpu_layers,
+        )
+        return False
+    return True
+
+
+def _supports_token_decode(llama: Llama) -> bool:
+    return _TOKEN_DECODE_BINDINGS and hasattr(llama, "_batch") and hasattr(llama, "_ctx")
+
+
+def _embed_tokens(llama: Llama, token_lists: list[list[int]]) -> list:
+    """Decode pre-tokenized inputs and return one embedding (or token matrix) per input."""
+    ctx = llama.ctx
+    n_embd = llama.n_embd()
+    n_batch = llama.n_batch
+    token_level = llama_cpp.llama_pooling_type(ctx) == llama_cpp.LLAMA_POOLING_TYPE_NONE
+    batch = llama._batch
+    outputs: list = []
+
+    def decode(seq_sizes: list[int]) -> None:
+        llama_cpp.llama_kv_cache_clear(ctx)
+        llama._ctx.decode(batch)
+        batch.reset()
+        if token_level:
+            ptr = llama_cpp.llama_get_embeddings(ctx)
+            offset = 0
+            for size in seq_sizes:
+                outputs.append(
+                    [
+                        ptr[(offset + row) * n_embd : (offset + row + 1) * n_embd]
+                        for row in range(size)
+                    ]
+                )
+                offset += size
+        else:
+            for seq_id in range(len(seq_sizes)):
+                ptr = llama_cpp.llama_get_embeddings_seq(ctx, seq_id)
+                outputs.append(ptr[:n_embd])
+
+    batch.reset()
+    seq_sizes: list[int] = []
+    batch_tokens = 0
+    for tokens in token_lists:
+        if seq_sizes and batch_tokens + len(tokens) > n_batch:
+            decode(seq_sizes)
+            seq_sizes, batch_tokens = [], 0
+        batch.add_sequence(tokens, len(seq_sizes), token_level)
+        seq_sizes.append(len(tokens))
+        batch_tokens += len(tokens)
+    if seq_sizes:
+        decode(seq_sizes)
+    return outputs
+
+
+def _pool_and_normalize(tokens: np.ndarray, normalize: bool = True) -> np.ndarray:
+    """Mean-pool a ``(n_tokens, n_embd)`` matrix, fusing the L2 norm into the same pass.
+
+    Only one sweep over the token buffer is needed: ``mean / ||mean||`` equals
+    ``sum / ||sum||``, so the ``1 / n_tokens`` factor cancels when normalizing.
+    """
+    summed = tokens.sum(axis=0)
+    if normalize:
+        return summed / max(float(np.sqrt(summed @ summed)), 1e-12)
+    return summed / len(tokens)
+
 
 class EmbeddingModel:
-    """Thread-safe lazy loader for llama.cpp embeddings."""
+    """Thread-safe lazy loader for a pool of llama.cpp embedding contexts."""
 
-    _instance: Llama | None = None
+    _pool: queue.Queue[Llama] | None = None
+    # Pooled contexts share one vocabulary; this one also tokenizes outside a checkout.
+    _tokenizer: Llama | None = None
     _lock = threading.Lock()
 
     def __init__(self) -> None:
         self._model_path: Path | None = None
+        # Keyed by (blake2b(text), normalize, pooling) so long inputs are not retained.
+        self._cache: OrderedDict[tuple[bytes, bool, str], tuple[tuple, int]] = OrderedDict()
+        self._cache_lock = threading.Lock()
 
     def _download_model(self) -> Path:
-        settings.model_cache_dir.mkdir(parents=True, exist_ok=True)
+        download_kwargs: dict[str, object] = {}
+        if settings.model_cache_dir is not None:
+            settings.model_cache_dir.mkdir(parents=True, exist_ok=True)
+            download_kwargs["local_dir"] = settings.model_cache_dir
+        # Without local_dir the shared hub cache (HF_HOME / HF_HUB_CACHE) is reused as-is.
         model_path = Path(
             hf_hub_download(
                 repo_id=settings.model_repo_id,
                 filename=settings.model_file,
-                local_dir=settings.model_cache_dir,
+                **download_kwargs,
             )
         )
         self._model_path = model_path
         return model_path
 
-    def _load_llama(self) -> Llama:
-        if EmbeddingModel._instance is not None:
-            return EmbeddingModel._instance
+    def _load_llama(self, model_path: Path, n_threads: int, *, offload: bool) -> Llama:
+        n_threads_batch = settings.threads_batch or n_threads
+        if offload:
+            # The GPU does the math; extra CPU threads would only contend with HTTP work.
+            n_threads = n_threads_batch = 1
+        llama = Llama(
+            model_path=str(model_path),
+            embedding=True,
+            n_ctx=settings.context_window,
+            n_threads=n_threads,
+            n_threads_batch=n_threads_batch,
+            n_batch=settings.batch_size,
+            n_ubatch=settings.ubatch_size,
+            n_gpu_layers=settings.gpu_layers if offload else 0,
+        )
+        # Non-causal embedding models (nomic-bert) abort unless a whole decode batch fits
+        # in one ubatch. llama_cpp releases without an n_ubatch parameter keep llama.cpp's
+        # 512-token default, so every packing path is capped via n_batch instead.
+        n_ubatch = getattr(llama.context_params, "n_ubatch", llama.n_batch)
+        if n_ubatch < llama.n_batch:
+            logger.warning(
+                "llama.cpp context uses n_ubatch=%d; capping decode batches and inputs "
+                "at %d tokens (LLM_BATCH_SIZE=%d).",
+                n_ubatch,
+                n_ubatch,
+                llama.n_batch,
+            )
+            llama.n_batch = n_ubatch
+        return llama
+
+    def _load_pool(self) -> queue.Queue[Llama]:
+        if EmbeddingModel._pool is not None:
+            return EmbeddingModel._pool
 
         with EmbeddingModel._lock:
-            if EmbeddingModel._instance is not None:
-                return EmbeddingModel._instance
+            if EmbeddingModel._pool is not None:
+                return EmbeddingModel._pool
 
             model_path = self._download_model()
-            EmbeddingModel._instance = Llama(
-                model_path=str(model_path),
-                embedding=True,
-                n_ctx=settings.context_window,
-                n_threads=settings.threads,
-                n_batch=settings.batch_size,
-                n_gpu_layers=0,
+            offload = _gpu_offload_enabled()
+            # Split the cores between contexts so parallel batches do not oversubscribe.
+            n_threads = settings.threads or max(1, _available_cores() // settings.pool_size)
+            # llama_cpp 0.2.75 exposes no ggml threadpool API, so llama.cpp keeps creating
+            # its worker threads per graph compute.
+            logger.info(
+                "Loading %d llama.cpp context(s) with %d thread(s) each; "
+                "using llama.cpp's per-compute threads.",
+                settings.pool_size,
+                n_threads,
             )
-            return EmbeddingModel._instance
+            pool: queue.Queue[Llama] = queue.Queue(maxsize=settings.pool_size)
+            for _ in range(settings.pool_size):
+                pool.put(self._load_llama(model_path, n_threads, offload=offload))
+            EmbeddingModel._tokenizer = pool.queue[0]
+            EmbeddingModel._pool = pool
+            return pool
 
     @staticmethod
     def _ensure_iterable(texts: Iterable[str] | str) -> List[str]:
+        # Lists are returned as-is; callers only read the payload.
+        if type(texts) is list:
+            return texts
         if isinstance(texts, str):
             return [texts]
         return list(texts)
@@ -88,40 +271,182 @@ class EmbeddingModel:
         normalize: bool = True,
         batch_size: int | None = None,
     ) -> list[list[float]]:
-        llama = self._load_llama()
+        return self.embed_with_usage(inputs, normalize=normalize, batch_size=batch_size)[0]
+
+    def embed_with_usage(
+        self,
+        inputs: Iterable[str] | str,
+        *,
+        normalize: bool = True,
+        batch_size: int | None = None,
+    ) -> tuple[list[list[float]], list[int]]:
+        """Embed ``inputs`` and also return the prompt token count of each input."""
         payload = self._ensure_iterable(inputs)
 
         if not payload:
-            return []
+            return [], []
+
+        embeddings: list[list[float] | None] = [None] * len(payload)
+        token_counts = [0] * len(payload)
+        keys = [self._cache_key(text, normalize) for text in payload]
+        # Identical misses within one call share a single slot in the llama.cpp batch.
+        misses: dict[tuple[bytes, bool, str], list[int]] = {}
+
+        with self._cache_lock:
+            for position, key in enumerate(keys):
+                cached = self._cache.get(key)
+                if cached is None:
+                    misses.setdefault(key, []).append(position)
+                    continue
+                self._cache.move_to_end(key)
+                embeddings[position] = list(cached[0])
+                token_counts[position] = cached[1]
+
+        if misses:
+            texts = [payload[group[0]] for group in misses.values()]
+            pool = self._load_pool()
+            # Tokenize before checking out a context, so this batch's tokenization
+            # overlaps the prefill another batch is running on the pool.
+            token_lists = self._tokenize_all(EmbeddingModel._tokenizer, texts)
+            llama = pool.get()
+            try:
+                vectors, counts = self._embed_with(
+                    llama, texts, normalize, batch_size, token_lists=token_lists
+                )
+            finally:
+                pool.put(llama)
+
+            for (key, group), vector, count in zip(misses.items(), vectors, counts):
+                for position in group:
+                    embeddings[position] = (
+                        vector if position == group[0] else self._copy_vector(vector)
+                    )
+                    token_counts[position] = count
+                self._cache_store(key, vector, count)
+
+        return embeddings, token_counts  # type: ignore[return-value]
+
+    def warm(self) -> None:
+        """Prime every pooled context with worst-case sized work, bypassing the cache.
 
+        A prompt of roughly ``n_ubatch`` tokens makes llama.cpp allocate its largest
+        compute buffers at startup; a full batch of short inputs primes the batch path.
+        """
+        pool = self._load_pool()
+        short_batch = ["warmup"] * settings.max_batch_size
+        contexts = [pool.get() for _ in range(settings.pool_size)]
+        try:
+            for llama in contexts:
+                # llama.n_batch is already clamped to the context's real n_ubatch, and
+                # _tokenize truncates to it, so the ~2-tokens-per-word overshoot is cut.
+                long_prompt = " ".join(["warmup"] * (llama.n_batch // 2 + 1))
+                self._embed_with(llama, [long_prompt], True, None)
+                self._embed_with(llama, short_batch, True, None)
+        finally:
+            for llama in contexts:
+                pool.put(llama)
+
+    @staticmethod
+    def _cache_key(text: str, normalize: bool) -> tuple[bytes, bool, str]:
+        digest = blake2b(text.encode("utf-8"), digest_size=16).digest()
+        return digest, normalize, settings.embedding_pooling
+
+    def _cache_store(
+        self, key: tuple[bytes, bool, str], vector: list[float], count: int
+    ) -> None:
+        if settings.embedding_cache_size <= 0:
+            return
+        if vector and isinstance(vector[0], list):
+            # Token-level output (pooling "none") can run to megabytes per input, which
+            # an entry-count bound cannot keep in check, so only pooled vectors are kept.
+            return
+        with self._cache_lock:
+            self._cache[key] = (tuple(vector), count)
+            self._cache.move_to_end(key)
+            while len(self._cache) > settings.embedding_cache_size:
+                self._cache.popitem(last=False)
+
+    @staticmethod
+    def _copy_vector(vector: list) -> list:
+        if vector and isinstance(vector[0], list):
+            return [list(row) for row in vector]
+        return list(vector)
+
+    @staticmethod
+    def _tokenize(llama: Llama, text: str) -> list[int]:
+        # special=False matches create_embedding, so literal markers such as "[SEP]" in
+        # user text stay text and both decode paths embed and count inputs identically.
+        # Match llama.cpp's own truncation so counts reflect what is actually decoded.
+        tokens = llama.tokenize(text.encode("utf-8"), add_bos=True, special=False)
+        return tokens[: llama.n_batch]
+
+    def _tokenize_all(self, llama: Llama, payload: list[str]) -> list[list[int]]:
+        # Tokenize once: the ids drive both the usage counts and the decode itself.
+        if len(payload) >= _PARALLEL_TOKENIZE_MIN_INPUTS:
+            return list(TOKENIZER_POOL.map(partial(self._tokenize, llama), payload))
+        return [self._tokenize(llama, text) for text in payload]
+
+    @staticmethod
+    def _create_embedding(llama: Llama, chunk: list[str], pooling: object) -> list:
+        response = _call_embed(llama, chunk, pooling)
+        return [item["embedding"] for item in response["data"] if "embedding" in item]
+
+    def _embed_with(
+        self,
+        llama: Llama,
+        payload: list[str],
+        normalize: bool,
+        batch_size: int | None,
+        token_lists: list[list[int]] | None = None,
+    ) -> tuple[list[list[float]], list[int]]:
         resolved_batch = min(batch_size or settings.max_batch_size, settings.max_batch_size)
-        embeddings: list[list[float]] = []
+        embeddings: list[list[float] | None] = [None] * len(payload)
         pooling = POOLING_OPTIONS.get(settings.embedding_pooling, POOLING_OPTIONS["mean"])
+        use_tokens = _supports_token_decode(llama)
+
+        if token_lists is None:
+            token_lists = self._tokenize_all(llama, payload)
+        token_counts = [len(tokens) for tokens in token_lists]
 
         for index in range(0, len(payload), resolved_batch):
-            chunk = payload[index : index + resolved_batch]
-            kwargs: dict[str, object] = {}
-            if _CREATE_EMBEDDING_ACCEPTS_POOLING:
-                kwargs["pooling_type"] = pooling
-            if _CREATE_EMBEDDING_ACCEPTS_NORMALIZE:
-                kwargs["normalize"] = normalize
-            response = llama.create_embedding(chunk, **kwargs)
-            chunk_embeddings = [
-                item["embedding"] for item in response["data"] if "embedding" in item
-            ]
-            if normalize and not _CREATE_EMBEDDING_ACCEPTS_NORMALIZE:
-                chunk_embeddings = [self._normalize_vector(vec) for vec in chunk_embeddings]
-            embeddings.extend(chunk_embeddings)
-
-        return embeddings
+            window = range(index, min(index + resolved_batch, len(payload)))
+            if use_tokens:
+                chunk_tokens = [token_lists[position] for position in window]
+                chunk_embeddings = _embed_tokens(llama, chunk_tokens)
+            else:
+                chunk = [payload[position] for position in window]
+                chunk_embeddings = self._create_embedding(llama, chunk, pooling)
+            if (
+                chunk_embeddings
+                and settings.embedding_pooling == "mean"
+                and isinstance(chunk_embeddings[0][0], list)
+            ):
+                # The context returned per-token vectors but mean pooling is configured.
+                chunk_embeddings = [
+                    _pool_and_normalize(np.asarray(tokens, np.float32), normalize).tolist()
+                    for tokens in chunk_embeddings
+                ]
+            elif normalize and chunk_embeddings:
+                chunk_embeddings = self._normalize_batch(chunk_embeddings)
+            if len(chunk_embeddings) != len(window):
+                raise RuntimeError(
+                    f"llama.cpp returned {len(chunk_embeddings)} embeddings "
+                    f"for {len(window)} inputs"
+                )
+            for position, vector in zip(window, chunk_embeddings):
+                embeddings[position] = vector
+
+        return embeddings, token_counts  # type: ignore[return-value]
 
     @staticmethod
-    def _normalize_vector(vector: list[float]) -> list[float]:
-        """Apply L2 normalization when llama.cpp does not support normalize kwarg."""
-        norm = math.sqrt(sum(value * value for value in vector))
-        if norm == 0:
-            return vector
-        return [value / norm for value in vector]
+    def _normalize_batch(vectors: list) -> list:
+        """L2-normalize a chunk of embeddings with a single vectorized NumPy pass."""
+        if isinstance(vectors[0][0], list):
+            # Token-level output (pooling "none") is ragged across inputs.
+            return [EmbeddingModel._normalize_batch(tokens) for tokens in vectors]
+        array = np.asarray(vectors, dtype=np.float32)
+        array /= np.linalg.norm(array, axis=-1, keepdims=True).clip(min=1e-12)
+        return array.tolist()
 
 
 @lru_cache(maxsize=1)
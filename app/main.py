@@ -1,31 +1,62 @@
 from __future__ import annotations
 
 import asyncio
+import base64
 import logging
 from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
 from typing import List
 
+import numpy as np
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 
+from .batching import BatchScheduler
 from .config import settings
 from .llm import EmbeddingModel, get_embedding_model
-from .schemas import EmbeddingData, EmbeddingRequest, EmbeddingResponse
+from .schemas import EmbeddingRequest, EmbeddingResponse
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
+# llama.cpp contexts are not reentrant, so blocking embed calls run on one worker thread
+# per pooled context and the event loop stays free to accept connections. One extra
+# worker lets the next batch tokenize while every context is busy decoding.
+EMBED_WORKERS = settings.pool_size + 1
+EXECUTOR = ThreadPoolExecutor(max_workers=EMBED_WORKERS, thread_name_prefix="embed")
+
 
 def _normalize_inputs(raw_input: Sequence[str] | str) -> List[str]:
+    # The request validator already yields a list, so avoid copying it again.
+    if type(raw_input) is list:
+        return raw_input
     if isinstance(raw_input, str):
         return [raw_input]
     return list(raw_input)
 
 
+def _encode_embedding(vector: list[float], encoding_format: str) -> list[float] | str:
+    """Return the vector as-is, or as base64 of its little-endian float32 bytes."""
+    if encoding_format == "base64":
+        return base64.b64encode(np.asarray(vector, dtype="<f4").tobytes()).decode("ascii")
+    return vector
+
+
 async def _warm_model(model: EmbeddingModel) -> None:
     loop = asyncio.get_running_loop()
-    await loop.run_in_executor(None, model.embed, ["warmup"])
+    await loop.run_in_executor(EXECUTOR, model.warm)
+
+
+def _build_batch_scheduler(model: EmbeddingModel) -> BatchScheduler:
+    return BatchScheduler(
+        model,
+        max_batch_size=settings.max_batch_size,
+        max_wait_ms=settings.batch_wait_ms,
+        max_concurrency=EMBED_WORKERS,
+        executor=EXECUTOR,
+    )
 
 
 @asynccontextmanager
@@ -38,13 +69,23 @@ async def lifespan(app: FastAPI):
     except Exception as exc:
         logger.warning("Model warmup failed: %s", exc)
 
-    yield
+    # The scheduler's queue and semaphore bind to the running loop, so each lifespan
+    # (and therefore each event loop) gets its own instance.
+    scheduler = _build_batch_scheduler(model)
+    scheduler.start()
+    app.state.batch_scheduler = scheduler
+    try:
+        yield
+    finally:
+        app.state.batch_scheduler = None
+        await scheduler.stop()
 
 
 app = FastAPI(
     title="Prime Radiant Embedding Service",
     version="0.1.0",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 app.add_middleware(
@@ -60,28 +101,41 @@ async def health() -> dict[str, str]:
     return {"status": "ok", "model": settings.model_file}
 
 
-@app.post("/v1/embeddings", response_model=EmbeddingResponse)
-async def create_embeddings(request: EmbeddingRequest) -> EmbeddingResponse:
+# The response is built as plain dicts and returned as an ORJSONResponse so large batches
+# skip per-float Pydantic validation and jsonable_encoder; EmbeddingResponse documents it.
+@app.post("/v1/embeddings", responses={200: {"model": EmbeddingResponse}})
+async def create_embeddings(request: EmbeddingRequest) -> ORJSONResponse:
     inputs = _normalize_inputs(request.input)
+    scheduler: BatchScheduler | None = getattr(app.state, "batch_scheduler", None)
+    if scheduler is None:
+        raise HTTPException(status_code=503, detail="Embedding scheduler is not running")
 
     try:
-        embeddings = get_embedding_model().embed(
-            inputs,
-            normalize=request.normalize,
-            batch_size=request.batch_size,
+        results = await asyncio.gather(
+            *(scheduler.submit(text, normalize=request.normalize) for text in inputs)
         )
     except Exception as exc:  # pragma: no cover - defensive, ensures clean error
         logger.exception("Failed to generate embeddings.")
         raise HTTPException(status_code=500, detail=f"Embedding failure: {exc}") from exc
 
-    data = [
-        EmbeddingData(index=index, embedding=vector)
-        for index, vector in enumerate(embeddings)
-    ]
-
-    return EmbeddingResponse(
-        data=data,
-        model=f"{settings.model_repo_id}:{settings.model_file}",
+    # Fill a preallocated list in one pass that also tallies usage.
+    data: list[dict | None] = [None] * len(results)
+    prompt_tokens = 0
+    for index, (vector, count) in enumerate(results):
+        data[index] = {
+            "index": index,
+            "embedding": _encode_embedding(vector, request.encoding_format),
+            "object": "embedding",
+        }
+        prompt_tokens += count
+
+    return ORJSONResponse(
+        {
+            "data": data,
+            "model": f"{settings.model_repo_id}:{settings.model_file}",
+            "object": "list",
+            "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens},
+        }
     )
 
 
@@ -1,31 +1,39 @@
 from __future__ import annotations
 
-from typing import List, Literal, Sequence, Union
+from typing import List, Literal, Union
 
 from pydantic import BaseModel, Field, field_validator
 
 
 class EmbeddingRequest(BaseModel):
-    input: Union[str, Sequence[str]]
+    input: Union[List[str], str]
     normalize: bool = Field(default=True)
-    batch_size: int | None = Field(default=None, ge=1)
+    batch_size: int | None = Field(
+        default=None,
+        ge=1,
+        deprecated="Ignored: the server micro-batches requests up to MAX_BATCH_SIZE.",
+    )
+    encoding_format: Literal["float", "base64"] = Field(default="float")
 
     @field_validator("input")
     @classmethod
-    def validate_input(cls, value: Union[str, Sequence[str]]) -> Union[str, Sequence[str]]:
-        if isinstance(value, (list, tuple)):
-            if not value:
-                raise ValueError("input must contain at least one string")
-            if not all(isinstance(item, str) and item.strip() for item in value):
+    def validate_input(cls, value: Union[List[str], str]) -> Union[List[str], str]:
+        if type(value) is str:
+            if not value.strip():
+                raise ValueError("input must be a non-empty string")
+            return value
+        if not value:
+            raise ValueError("input must contain at least one string")
+        # Single pass; plain type checks keep this cheap for very large payloads.
+        for item in value:
+            if type(item) is not str or not item.strip():
                 raise ValueError("each item in input must be a non-empty string")
-        elif not isinstance(value, str) or not value.strip():
-            raise ValueError("input must be a non-empty string")
         return value
 
 
 class EmbeddingData(BaseModel):
     index: int
-    embedding: List[float]
+    embedding: Union[List[float], str]
     object: Literal["embedding"] = "embedding"
 
 
@@ -4,9 +4,13 @@ from __future__ import annotations
 Latency probe for the Prime Radiant embedding API.
 
 Run `python scripts/measure_latency.py --help` for a full list of flags and usage examples.
+Requires `httpx`; HTTP/2 multiplexing additionally needs `pip install "httpx[http2]"`,
+and the probe falls back to HTTP/1.1 keep-alive when that extra is missing.
 """
 
 import argparse
+import asyncio
+import importlib.util
 import statistics
 import time
 from typing import Sequence
@@ -17,6 +21,7 @@ import httpx
 DEFAULT_BASE_URL = "https://pr-embedding.onrender.com"
 DEFAULT_COUNT    = 5
 DEFAULT_WARMUP   = 1
+DEFAULT_CONCURRENCY = 1
 DEFAULT_TIMEOUT  = 120.0
 DEFAULT_INPUTS   = [
     "Prime Radiant latency check.",
@@ -49,6 +54,15 @@ def build_parser() -> argparse.ArgumentParser:
         default=DEFAULT_WARMUP,
         help="Number of warmup requests to send before measuring latency.",
     )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help=(
+            "Maximum number of timed requests in flight at once. Raise it to exercise "
+            "the server's micro-batching."
+        ),
+    )
     parser.add_argument(
         "--input",
         dest="inputs",
@@ -59,12 +73,6 @@ def build_parser() -> argparse.ArgumentParser:
             "per request. Defaults to a single canned prompt."
         ),
     )
-    parser.add_argument(
-        "--batch-size",
-        type=int,
-        default=None,
-        help="Override the batch size used by the embedding call.",
-    )
     parser.add_argument(
         "--normalize",
         action=argparse.BooleanOptionalAction,
@@ -77,6 +85,12 @@ def build_parser() -> argparse.ArgumentParser:
         default=DEFAULT_TIMEOUT,
         help="HTTP client timeout in seconds.",
     )
+    parser.add_argument(
+        "--http2",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="Multiplex requests over one HTTP/2 connection (default: enabled).",
+    )
     return parser
 
 
@@ -92,19 +106,22 @@ def ensure_list(inputs: Sequence[str] | None) -> list[str]:
     return list(inputs)
 
 
-def run_trial(
-    client: httpx.Client,
+async def run_trial(
+    client: httpx.AsyncClient,
     url: str,
     payload: dict,
+    semaphore: asyncio.Semaphore,
 ) -> float:
     """
     Execute a single POST to the embeddings endpoint and return elapsed seconds.
 
-    The timer wraps both network time and server-side processing latency.
+    The timer starts once the semaphore grants a slot, so it wraps network time and
+    server-side processing latency but not time spent queued on the client.
     """
-    start = time.perf_counter()
-    response = client.post(url, json=payload)
-    elapsed = time.perf_counter() - start
+    async with semaphore:
+        start = time.perf_counter()
+        response = await client.post(url, json=payload)
+        elapsed = time.perf_counter() - start
     response.raise_for_status()
     return elapsed
 
@@ -114,26 +131,39 @@ def format_ms(value: float) -> str:
     return f"{value * 1_000:.1f} ms"
 
 
-def main() -> None:
+async def main() -> None:
     """Parse CLI arguments, warm the model, then capture latency statistics."""
     args = build_parser().parse_args()
     base_url = args.base_url.rstrip("/")
     health_url = f"{base_url}/health"
     embeddings_url = f"{base_url}/v1/embeddings"
     inputs = ensure_list(args.inputs)
+    semaphore = asyncio.Semaphore(max(1, args.concurrency))
+
+    http2 = args.http2
+    if http2 and importlib.util.find_spec("h2") is None:
+        print(
+            "Note: the 'h2' package is not installed; falling back to HTTP/1.1 "
+            'keep-alive. Install "httpx[http2]" to multiplex over HTTP/2.'
+        )
+        http2 = False
 
     # The API accepts either a single string or a list, so keep the payload compact.
     payload = {
         "input": inputs if len(inputs) > 1 else inputs[0],
         "normalize": args.normalize,
     }
-    if args.batch_size:
-        payload["batch_size"] = args.batch_size
 
-    with httpx.Client(timeout=args.timeout) as client:
+    # HTTP/2 multiplexes every call over one connection. HTTP/1.1 needs one connection
+    # per in-flight request, so the pool keeps one alive for each concurrency slot.
+    slots = max(1, args.concurrency)
+    limits = httpx.Limits(max_connections=slots, max_keepalive_connections=slots)
+    async with httpx.AsyncClient(
+        http2=http2, timeout=args.timeout, limits=limits
+    ) as client:
         # Probe /health to confirm the service is reachable before timing requests.
         try:
-            health = client.get(health_url)
+            health = await client.get(health_url)
             health.raise_for_status()
         except httpx.HTTPError as exc:
             raise SystemExit(
@@ -143,20 +173,30 @@ def main() -> None:
 
         model_name = health.json().get("model", "unknown")
         print(
-            f"Health check OK — model: {model_name}. "
+            f"Health check OK — model: {model_name} ({health.http_version}). "
             "Tip: run with --help to see more options."
         )
 
+        if not http2 and slots > 1:
+            # Open every slot's connection now so TLS handshakes stay out of the timings.
+            await asyncio.gather(*(client.get(health_url) for _ in range(slots)))
+
         # Warmups get the model into RAM before the timed trials.
         for index in range(args.warmup):
-            run_trial(client, embeddings_url, payload)
+            await run_trial(client, embeddings_url, payload, semaphore)
             print(f"Warmup {index + 1}/{args.warmup} complete.")
 
-        timings: list[float] = []
-        for attempt in range(args.count):
-            elapsed = run_trial(client, embeddings_url, payload)
-            timings.append(elapsed)
-            print(f"Trial {attempt + 1}/{args.count}: {format_ms(elapsed)}")
+        wall_start = time.perf_counter()
+        timings: list[float] = await asyncio.gather(
+            *(
+                run_trial(client, embeddings_url, payload, semaphore)
+                for _ in range(args.count)
+            )
+        )
+        wall_elapsed = time.perf_counter() - wall_start
+
+    for attempt, elapsed in enumerate(timings):
+        print(f"Trial {attempt + 1}/{args.count}: {format_ms(elapsed)}")
 
     if not timings:
         print("No timings collected.")
@@ -174,7 +214,12 @@ def main() -> None:
     print(f"  fastest: {format_ms(fastest)}")
     print(f"  slowest: {format_ms(slowest)}")
 
+    # Aggregate throughput shows how well the server batches concurrent callers.
+    print(f"\nThroughput ({args.count} requests, concurrency {args.concurrency}):")
+    print(f"  elapsed: {format_ms(wall_elapsed)}")
+    print(f"  rate   : {args.count / wall_elapsed:.2f} req/s")
+
 
 if __name__ == "__main__":
     # Allow the script to be invoked directly from the CLI.
-    main()
+    asyncio.run(main())
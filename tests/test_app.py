@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+from fastapi.testclient import TestClient
+
+import app.main as main
+
+
+class StubModel:
+    def warm(self) -> None:
+        pass
+
+    def embed_with_usage(self, texts, *, normalize=True):
+        return [[float(len(text))] for text in texts], [len(text) for text in texts]
+
+
+def test_scheduler_survives_repeated_lifespans(monkeypatch) -> None:
+    monkeypatch.setattr(main, "get_embedding_model", lambda: StubModel())
+
+    # Each TestClient session runs the lifespan on a fresh event loop.
+    for _ in range(2):
+        with TestClient(main.app) as client:
+            response = client.post("/v1/embeddings", json={"input": ["a", "bcd"]})
+        assert response.status_code == 200
+        body = response.json()
+        assert [item["embedding"] for item in body["data"]] == [[1.0], [3.0]]
+        assert body["usage"] == {"prompt_tokens": 4, "total_tokens": 4}
+
+
+def test_requests_outside_the_lifespan_are_rejected() -> None:
+    client = TestClient(main.app)  # no context manager: lifespan never runs
+
+    response = client.post("/v1/embeddings", json={"input": "a"})
+
+    assert response.status_code == 503
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+
+import pytest
+
+from app.batching import BatchScheduler
+
+
+class StubModel:
+    """Stands in for EmbeddingModel: vectors encode the text, counts its length."""
+
+    def __init__(self, error: Exception | None = None, drop_last: bool = False) -> None:
+        self.calls: list[tuple[list[str], bool]] = []
+        self._error = error
+        self._drop_last = drop_last
+        self._lock = threading.Lock()
+
+    def embed_with_usage(
+        self, texts: list[str], *, normalize: bool = True
+    ) -> tuple[list[list[float]], list[int]]:
+        with self._lock:
+            self.calls.append((list(texts), normalize))
+        if self._error is not None:
+            raise self._error
+        vectors = [[float(len(text)), float(normalize)] for text in texts]
+        counts = [len(text) for text in texts]
+        if self._drop_last:
+            vectors, counts = vectors[:-1], counts[:-1]
+        return vectors, counts
+
+
+def _run(coro):
+    # Every scenario must finish promptly; a hang means a future was never resolved.
+    return asyncio.run(asyncio.wait_for(coro, timeout=5))
+
+
+async def _submit_all(scheduler: BatchScheduler, texts: list[str], normalize: bool = True):
+    try:
+        return await asyncio.gather(
+            *(scheduler.submit(text, normalize=normalize) for text in texts),
+            return_exceptions=True,
+        )
+    finally:
+        await scheduler.stop()
+
+
+def test_concurrent_submissions_share_one_call() -> None:
+    model = StubModel()
+    scheduler = BatchScheduler(model, max_batch_size=8, max_wait_ms=50)
+
+    results = _run(_submit_all(scheduler, ["a", "bb", "ccc"]))
+
+    assert model.calls == [(["a", "bb", "ccc"], True)]
+    assert results == [([1.0, 1.0], 1), ([2.0, 1.0], 2), ([3.0, 1.0], 3)]
+
+
+def test_batches_are_capped_at_max_batch_size() -> None:
+    model = StubModel()
+    scheduler = BatchScheduler(model, max_batch_size=2, max_wait_ms=50)
+
+    results = _run(_submit_all(scheduler, ["a", "b", "c", "d", "e"]))
+
+    assert [len(texts) for texts, _ in model.calls] == [2, 2, 1]
+    assert [count for _, count in results] == [1, 1, 1, 1, 1]
+
+
+def test_normalize_flags_are_dispatched_separately() -> None:
+    model = StubModel()
+    scheduler = BatchScheduler(model, max_batch_size=8, max_wait_ms=50)
+
+    async def scenario():
+        try:
+            return await asyncio.gather(
+                scheduler.submit("raw", normalize=False),
+                scheduler.submit("unit", normalize=True),
+            )
+        finally:
+            await scheduler.stop()
+
+    raw, unit = _run(scenario())
+
+    assert sorted(model.calls) == [(["raw"], False), (["unit"], True)]
+    assert raw == ([3.0, 0.0], 3)
+    assert unit == ([4.0, 1.0], 4)
+
+
+def test_model_errors_fan_out_to_every_caller() -> None:
+    model = StubModel(error=ValueError("boom"))
+    scheduler = BatchScheduler(model, max_batch_size=8, max_wait_ms=50)
+
+    results = _run(_submit_all(scheduler, ["a", "b", "c"]))
+
+    assert len(model.calls) == 1
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_short_results_fail_instead_of_hanging() -> None:
+    model = StubModel(drop_last=True)
+    scheduler = BatchScheduler(model, max_batch_size=8, max_wait_ms=50)
+
+    results = _run(_submit_all(scheduler, ["a", "b", "c"]))
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_scheduler_keeps_serving_after_a_failure() -> None:
+    model = StubModel(error=ValueError("boom"))
+    scheduler = BatchScheduler(model, max_batch_size=8, max_wait_ms=10)
+
+    async def scenario():
+        try:
+            with pytest.raises(ValueError):
+                await scheduler.submit("first")
+            model._error = None
+            return await scheduler.submit("second")
+        finally:
+            await scheduler.stop()
+
+    assert _run(scenario()) == ([6.0, 1.0], 6)
+
+
+def test_stop_fails_in_flight_and_queued_requests() -> None:
+    release = threading.Event()
+
+    class BlockingModel(StubModel):
+        def embed_with_usage(self, texts, *, normalize=True):
+            release.wait(timeout=5)
+            return super().embed_with_usage(texts, normalize=normalize)
+
+    scheduler = BatchScheduler(BlockingModel(), max_batch_size=1, max_wait_ms=0)
+
+    async def scenario():
+        pending = [
+            asyncio.ensure_future(scheduler.submit(text)) for text in ("a", "b", "c")
+        ]
+        await asyncio.sleep(0.05)  # "a" is in flight, "b" and "c" are still queued
+        try:
+            await scheduler.stop()
+            return await asyncio.gather(*pending, return_exceptions=True)
+        finally:
+            release.set()
+
+    results = _run(scenario())
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_dead_worker_fails_queued_requests() -> None:
+    scheduler = BatchScheduler(StubModel(), max_batch_size=8, max_wait_ms=10)
+
+    async def broken_collect():
+        raise RuntimeError("worker crashed")
+
+    scheduler._collect = broken_collect  # type: ignore[method-assign]
+
+    async def scenario():
+        try:
+            return await asyncio.gather(scheduler.submit("a"), return_exceptions=True)
+        finally:
+            await scheduler.stop()
+
+    (result,) = _run(scenario())
+
+    assert isinstance(result, RuntimeError)
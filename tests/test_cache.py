@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import queue
+
+import pytest
+
+from app.config import settings
+from app.llm import EmbeddingModel
+
+
+@pytest.fixture
+def model(monkeypatch: pytest.MonkeyPatch) -> EmbeddingModel:
+    """EmbeddingModel whose llama.cpp work is replaced by a recording stub."""
+    monkeypatch.setattr(settings, "embedding_cache_size", 16)
+    instance = EmbeddingModel()
+    pool: queue.Queue = queue.Queue()
+    pool.put(object())
+    instance.calls = []
+
+    def fake_embed_with(llama, payload, normalize, batch_size, token_lists=None):
+        instance.calls.append(list(payload))
+        vectors = [[float(len(text)), float(normalize)] for text in payload]
+        return vectors, [len(text) for text in payload]
+
+    monkeypatch.setattr(instance, "_load_pool", lambda: pool)
+    monkeypatch.setattr(instance, "_tokenize", lambda llama, text: [0] * len(text))
+    monkeypatch.setattr(instance, "_embed_with", fake_embed_with)
+    return instance
+
+
+def test_hits_and_misses_keep_input_order(model: EmbeddingModel) -> None:
+    model.embed_with_usage(["a", "ccc"])
+
+    vectors, counts = model.embed_with_usage(["bb", "a", "dddd", "ccc"])
+
+    assert model.calls == [["a", "ccc"], ["bb", "dddd"]]
+    assert vectors == [[2.0, 1.0], [1.0, 1.0], [4.0, 1.0], [3.0, 1.0]]
+    assert counts == [2, 1, 4, 3]
+
+
+def test_fully_cached_payload_skips_the_model(model: EmbeddingModel) -> None:
+    model.embed_with_usage(["a", "bb"])
+
+    vectors, counts = model.embed_with_usage(["bb", "a"])
+
+    assert model.calls == [["a", "bb"]]
+    assert vectors == [[2.0, 1.0], [1.0, 1.0]]
+    assert counts == [2, 1]
+
+
+def test_duplicate_misses_are_embedded_once(model: EmbeddingModel) -> None:
+    vectors, counts = model.embed_with_usage(["x", "yy", "x"])
+
+    assert model.calls == [["x", "yy"]]
+    assert vectors == [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0]]
+    assert counts == [1, 2, 1]
+    # Duplicates must not alias one list, or mutating one result would change another.
+    assert vectors[0] is not vectors[2]
+
+
+def test_normalize_flag_is_part_of_the_key(model: EmbeddingModel) -> None:
+    model.embed_with_usage(["a"], normalize=True)
+    vectors, _ = model.embed_with_usage(["a"], normalize=False)
+
+    assert model.calls == [["a"], ["a"]]
+    assert vectors == [[1.0, 0.0]]
+
+
+def test_least_recently_used_entry_is_evicted(
+    model: EmbeddingModel, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "embedding_cache_size", 2)
+    model.embed_with_usage(["a"])
+    model.embed_with_usage(["b"])
+    model.embed_with_usage(["a"])  # hit: "b" is now the least recently used
+    model.embed_with_usage(["c"])  # evicts "b"
+
+    model.embed_with_usage(["a", "b"])
+
+    assert model.calls == [["a"], ["b"], ["c"], ["b"]]
+    assert len(model._cache) == 2
+
+
+def test_zero_cache_size_disables_caching(
+    model: EmbeddingModel, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "embedding_cache_size", 0)
+
+    model.embed_with_usage(["a"])
+    model.embed_with_usage(["a"])
+
+    assert model.calls == [["a"], ["a"]]
+    assert not model._cache
+
+
+def test_token_level_results_are_not_cached(
+    model: EmbeddingModel, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    def token_level_embed_with(llama, payload, normalize, batch_size, token_lists=None):
+        model.calls.append(list(payload))
+        return [[[1.0, 0.0], [0.0, 1.0]] for _ in payload], [2] * len(payload)
+
+    monkeypatch.setattr(model, "_embed_with", token_level_embed_with)
+
+    vectors, _ = model.embed_with_usage(["x", "x"])
+    model.embed_with_usage(["x"])
+
+    assert model.calls == [["x"], ["x"]]
+    assert not model._cache
+    # Duplicates get their own per-token rows, not views of the first result.
+    assert vectors[0] == vectors[1]
+    assert vectors[0][0] is not vectors[1][0]
+
+
+def test_misses_are_tokenized_before_a_context_is_checked_out(
+    model: EmbeddingModel, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    events: list[str] = []
+
+    class RecordingPool(queue.Queue):
+        def get(self, *args, **kwargs):
+            events.append("checkout")
+            return super().get(*args, **kwargs)
+
+    pool = RecordingPool()
+    pool.put(object())
+
+    def recording_tokenize(llama, text):
+        events.append(f"tokenize {text}")
+        return [0] * len(text)
+
+    def recording_embed_with(llama, payload, normalize, batch_size, token_lists=None):
+        events.append(f"decode {token_lists}")
+        return [[0.0] for _ in payload], [len(tokens) for tokens in token_lists]
+
+    monkeypatch.setattr(model, "_load_pool", lambda: pool)
+    monkeypatch.setattr(model, "_tokenize", recording_tokenize)
+    monkeypatch.setattr(model, "_embed_with", recording_embed_with)
+
+    _, counts = model.embed_with_usage(["a", "bb"])
+
+    assert events == ["tokenize a", "tokenize bb", "checkout", "decode [[0], [0, 0]]"]
+    assert counts == [1, 2]
@@ -0,0 +1,24 @@
+from __future__ import annotations
+
+import base64
+
+import numpy as np
+
+from app.main import _encode_embedding
+
+
+def test_float_format_returns_vector_unchanged() -> None:
+    vector = [0.5, -1.25, 3.0]
+
+    assert _encode_embedding(vector, "float") is vector
+
+
+def test_base64_format_is_little_endian_float32() -> None:
+    vector = [0.5, -1.25, 3.0, 1e-3]
+
+    encoded = _encode_embedding(vector, "base64")
+
+    raw = base64.b64decode(encoded)
+    assert len(raw) == 4 * len(vector)
+    decoded = np.frombuffer(raw, dtype="<f4")
+    np.testing.assert_allclose(decoded, np.asarray(vector, dtype=np.float32))
@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from app.config import settings
+from app.llm import EmbeddingModel, _pool_and_normalize
+
+TOKENS = [[3.0, 0.0], [1.0, 4.0], [2.0, 2.0]]
+
+
+def test_normalized_pool_equals_unit_mean() -> None:
+    matrix = np.asarray(TOKENS, np.float32)
+    mean = matrix.mean(axis=0)
+
+    pooled = _pool_and_normalize(matrix, normalize=True)
+
+    np.testing.assert_allclose(pooled, mean / np.linalg.norm(mean), rtol=1e-6)
+
+
+def test_unnormalized_pool_is_the_plain_mean() -> None:
+    matrix = np.asarray(TOKENS, np.float32)
+
+    pooled = _pool_and_normalize(matrix, normalize=False)
+
+    np.testing.assert_allclose(pooled, matrix.mean(axis=0), rtol=1e-6)
+
+
+def _embed(monkeypatch: pytest.MonkeyPatch, pooling: str, output: list) -> list:
+    monkeypatch.setattr(settings, "embedding_pooling", pooling)
+    model = EmbeddingModel()
+    # A plain object has no low-level batch, so _embed_with uses create_embedding.
+    monkeypatch.setattr(model, "_create_embedding", lambda llama, chunk, _: output)
+    vectors, _ = model._embed_with(object(), ["text"], False, None, token_lists=[[0]])
+    return vectors
+
+
+def test_token_level_output_is_pooled_when_mean_is_configured(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    (vector,) = _embed(monkeypatch, "mean", [TOKENS])
+
+    np.testing.assert_allclose(vector, np.mean(TOKENS, axis=0), rtol=1e-6)
+
+
+def test_token_level_output_is_kept_for_pooling_none(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    assert _embed(monkeypatch, "none", [TOKENS]) == [TOKENS]
+
+
+def test_pooled_output_is_not_pooled_again(monkeypatch: pytest.MonkeyPatch) -> None:
+    assert _embed(monkeypatch, "mean", [[3.0, 4.0]]) == [[3.0, 4.0]]
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import llama_cpp
+import pytest
+
+from app.llm import _embed_tokens
+
+N_EMBD = 2
+
+
+class FakeBatch:
+    """Records sequences the way llama_batch would hold them between decodes."""
+
+    def __init__(self) -> None:
+        self.sequences: list[tuple[list[int], int]] = []
+
+    def reset(self) -> None:
+        self.sequences = []
+
+    def add_sequence(self, tokens: list[int], seq_id: int, logits_all: bool) -> None:
+        self.sequences.append((list(tokens), seq_id))
+
+
+class FakeContext:
+    def __init__(self, batch: FakeBatch) -> None:
+        self._batch = batch
+        self.decoded: list[list[list[int]]] = []
+        self.rows: list[float] = []
+        self.pooled: dict[int, list[float]] = {}
+
+    def decode(self, batch: FakeBatch) -> None:
+        self.decoded.append([tokens for tokens, _ in batch.sequences])
+        # Token rows are [token id, position]; pooled rows are [first token, seq id]
+        # plus padding that _embed_tokens must slice off at n_embd.
+        self.rows = [
+            value
+            for tokens, _ in batch.sequences
+            for position, token in enumerate(tokens)
+            for value in (float(token), float(position))
+        ]
+        self.pooled = {
+            seq_id: [float(tokens[0]), float(seq_id), -1.0]
+            for tokens, seq_id in batch.sequences
+        }
+
+
+class FakeLlama:
+    def __init__(self, n_batch: int) -> None:
+        self.ctx = object()
+        self.n_batch = n_batch
+        self._batch = FakeBatch()
+        self._ctx = FakeContext(self._batch)
+
+    def n_embd(self) -> int:
+        return N_EMBD
+
+
+@pytest.fixture
+def llama(monkeypatch: pytest.MonkeyPatch) -> FakeLlama:
+    instance = FakeLlama(n_batch=5)
+    monkeypatch.setattr(llama_cpp, "llama_kv_cache_clear", lambda ctx: None)
+    monkeypatch.setattr(llama_cpp, "llama_get_embeddings", lambda ctx: instance._ctx.rows)
+    monkeypatch.setattr(
+        llama_cpp,
+        "llama_get_embeddings_seq",
+        lambda ctx, seq_id: instance._ctx.pooled[seq_id],
+    )
+    return instance
+
+
+def _set_pooling(monkeypatch: pytest.MonkeyPatch, pooling: int) -> None:
+    monkeypatch.setattr(llama_cpp, "llama_pooling_type", lambda ctx: pooling)
+
+
+def test_decode_batches_split_at_n_batch_and_keep_input_order(
+    llama: FakeLlama, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    _set_pooling(monkeypatch, llama_cpp.LLAMA_POOLING_TYPE_MEAN)
+    # 2 + 3 tokens fill n_batch=5 exactly; the next input starts a new decode.
+    token_lists = [[10, 11], [20, 21, 22], [30, 31, 32, 33], [40]]
+
+    outputs = _embed_tokens(llama, token_lists)
+
+    assert llama._ctx.decoded == [
+        [[10, 11], [20, 21, 22]],
+        [[30, 31, 32, 33], [40]],
+    ]
+    # Sequence ids restart per decode, and vectors are trimmed to n_embd.
+    assert outputs == [[10.0, 0.0], [20.0, 1.0], [30.0, 0.0], [40.0, 1.0]]
+
+
+def test_token_level_rows_follow_each_sequence_offset(
+    llama: FakeLlama, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    _set_pooling(monkeypatch, llama_cpp.LLAMA_POOLING_TYPE_NONE)
+    token_lists = [[10, 11], [20, 21, 22], [30]]
+
+    outputs = _embed_tokens(llama, token_lists)
+
+    assert llama._ctx.decoded == [[[10, 11], [20, 21, 22]], [[30]]]
+    assert outputs == [
+        [[10.0, 0.0], [11.0, 1.0]],
+        [[20.0, 0.0], [21.0, 1.0], [22.0, 2.0]],
+        [[30.0, 0.0]],
+    ]
@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+import queue
+
+import pytest
+
+from app.config import settings
+from app.llm import EmbeddingModel
+
+
+class StubLlama:
+    """Tokenizes like nomic-bert's "warm", "##up" split: two ids per word plus CLS/SEP."""
+
+    def __init__(self, n_batch: int) -> None:
+        self.n_batch = n_batch
+
+    def tokenize(
+        self, text: bytes, add_bos: bool = True, special: bool = False
+    ) -> list[int]:
+        return [0] * (2 * len(text.split()) + 2)
+
+
+def test_warm_fills_but_never_exceeds_each_context_batch(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(settings, "pool_size", 2)
+    contexts = [StubLlama(n_batch=512), StubLlama(n_batch=2048)]
+    pool: queue.Queue = queue.Queue()
+    for llama in contexts:
+        pool.put(llama)
+    model = EmbeddingModel()
+    decoded: list[tuple[StubLlama, list[int]]] = []
+
+    def fake_embed_with(llama, payload, normalize, batch_size):
+        decoded.extend((llama, model._tokenize(llama, text)) for text in payload)
+        return [[0.0]] * len(payload), [0] * len(payload)
+
+    monkeypatch.setattr(model, "_load_pool", lambda: pool)
+    monkeypatch.setattr(model, "_embed_with", fake_embed_with)
+
+    model.warm()
+
+    for llama in contexts:
+        lengths = [len(tokens) for owner, tokens in decoded if owner is llama]
+        assert max(lengths) == llama.n_batch
+    assert pool.qsize() == len(contexts)